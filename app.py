@@ -1,3 +1,4 @@
+import io
 import time
 import re
 from .config_loader import load_config
@@ -9,6 +10,20 @@ DEFAULT_SWITCH_MODEL = "Cisco 2960X"
 SERIAL_PORT = "COM4"
 APP_NAME = "OT-AI"
 
+# "(you are) connected to (a) Cisco X (switch) over serial port COMn" style setup phrase. The filler words
+# around the model are bounded and lazy, so a failed attempt gives up after a few tokens instead of backtracking far.
+_CONNECT_RE = re.compile(
+    r"\b(?:(?:you\s+are\s+)?connect(?:ed)?\s+to\s+(?:\S+\s+){0,3}?|(?:on|over|via)\s+(?=cisco\s))?"
+    r"(?:(?P<model>cisco\s+(?:catalyst\s+)?[a-z0-9-]+)\s+(?:\S+\s+){0,2}?)?"
+    r"(?:(?:on|over|via)\s+)?(?:serial\s+)?(?:port\s+)?(?P<port>com\d+)\b\.?",
+    re.IGNORECASE
+)
+# "Cisco X" anywhere in the statement, for setup phrases that name no COM port
+_MODEL_RE = re.compile(r"\bcisco\s+(?:catalyst\s+)?(?!(?:over|on|port)\b)(?P<model>[a-z0-9-]+)", re.IGNORECASE)
+# First IOS error/warning line ("% Invalid input ...", "%Error opening tftp://..."); console syslog
+# messages such as %LINK-3-UPDOWN: and values like 5%/0% are not failures
+_ERR_RE = re.compile(r"^\s*%(?![A-Z0-9_]+-\d+-[A-Z0-9_]+:).*$", re.MULTILINE)
+
 
 class CiscoAIAssistant:
     def __init__(self):
@@ -20,7 +35,10 @@ class CiscoAIAssistant:
             exit(1)
 
         self.switch_comm = SwitchCommunicator(port=SERIAL_PORT)
-        self.llm_translator = LLMTranslator(api_key=self.config['gemini_api_key'])
+        self.llm_translator = LLMTranslator(
+            api_key=self.config['gemini_api_key'],
+            semantic_cache=bool(self.config.get('semantic_cache', False))
+        )
         self.switch_model = DEFAULT_SWITCH_MODEL
 
     def _initial_setup(self):
@@ -46,37 +64,25 @@ class CiscoAIAssistant:
         return True
 
 
-    def _parse_initial_user_statement(self, statement: str):
+    def _parse_initial_user_statement(self, statement: str) -> str:
+        """Extracts switch model/port from the setup phrase and returns the statement without it."""
         global SERIAL_PORT 
         
-        words = statement.lower().split()
-        try:
-            cisco_idx = words.index("cisco")
-            if cisco_idx + 1 < len(words) and words[cisco_idx+1] not in ["over", "on", "port"]:
-                self.switch_model = f"Cisco {words[cisco_idx+1].upper()}"
-                print(f"SYSTEM: Switch model identified as {self.switch_model}.")
-        except ValueError:
-            pass
+        match = _CONNECT_RE.search(statement)
+        model_match = _MODEL_RE.search(match.group("model") if match and match.group("model") else statement)
+        if model_match:
+            self.switch_model = f"Cisco {model_match.group('model').upper()}"
+            print(f"SYSTEM: Switch model identified as {self.switch_model}.")
+        if not match:
+            return statement
 
-        try:
-            port_idx = -1
-            for i, word in enumerate(words):
-                if word.startswith("com") and len(word) > 3 and word[3:].isdigit():
-                    port_idx = i
-                    new_port = word.upper()
-                    break
-                if word == "port" and i + 1 < len(words) and words[i+1].upper().startswith("COM"):
-                    port_idx = i +1
-                    new_port = words[i+1].upper()
-                    break
-            
-            if port_idx != -1:
-                if new_port != SERIAL_PORT:
-                    SERIAL_PORT = new_port 
-                    self.switch_comm.port = SERIAL_PORT 
-                    print(f"SYSTEM: Serial port updated to {SERIAL_PORT}.")
-        except ValueError:
-            pass
+        new_port = match.group("port").upper()
+        if new_port != SERIAL_PORT:
+            SERIAL_PORT = new_port 
+            self.switch_comm.port = SERIAL_PORT 
+            print(f"SYSTEM: Serial port updated to {SERIAL_PORT}.")
+
+        return statement[:match.start()] + statement[match.end():]
 
 
     def run(self):
@@ -88,21 +94,13 @@ class CiscoAIAssistant:
             print(f"{APP_NAME}: Exiting.")
             return
 
-        self._parse_initial_user_statement(initial_query)
+        cleaned_query = self._parse_initial_user_statement(initial_query).strip(" .")
 
         if not self._initial_setup():
             print(f"{APP_NAME}: Could not establish connection with the switch. Exiting.")
             return
         
         task_query = initial_query
-        cleaned_query = initial_query
-        patterns_to_remove = [
-            r"you are connected to .*?(cisco \w+)? (over|on) serial port (com\d+)\s*\.?",
-            r"(connect(ed)? to )?(cisco \w+)? (on|over|via) (port )?(com\d+)\s*\.?",
-        ]
-        for pattern in patterns_to_remove:
-            cleaned_query = re.sub(pattern, "", cleaned_query, flags=re.IGNORECASE).strip(" .")
-        
         if cleaned_query and len(cleaned_query) < len(initial_query) / 1.5 : # Heuristic: if significantly shorter, it's likely the task
             task_query = cleaned_query
         elif not cleaned_query and ("cisco" in initial_query.lower() or "com" in initial_query.lower()):
@@ -126,30 +124,53 @@ class CiscoAIAssistant:
         self.switch_comm.disconnect()
         print(f"{APP_NAME}: Goodbye!")
 
-    def _execute_commands(self, commands_to_run: list) -> tuple[list, bool]:
-        """Helper to execute a list of commands and collect outputs."""
-        all_outputs = []
+    def _execute_commands(self, commands_to_run: list, verification_cmd: str = "") -> tuple[str, bool, str]:
+        """
+        Helper to execute a list of commands and collect their outputs into one string.
+        If given, verification_cmd rides along in the same batch; its output is returned
+        as the third element (None when it could not be batched and still has to be sent).
+        """
+        all_outputs = io.StringIO()
         success = True
+        verification_output = None
         if not commands_to_run:
-            return all_outputs, success
+            return "", success, verification_output
 
         print(f"{APP_NAME}: I will run the following preparatory/task commands:")
         for cmd in commands_to_run:
             print(f"  - {cmd}")
         
+        batch_outputs = None
+        batch = commands_to_run + [verification_cmd] if verification_cmd else commands_to_run
+        if self.switch_comm.can_batch(batch):
+            print(f"\n{APP_NAME}: Executing {len(batch)} commands in one batch")
+            batch_outputs = self.switch_comm.send_command_batch(batch, timeout_override=15 if verification_cmd else None)
+            if verification_cmd:
+                verification_output = batch_outputs.pop()
+
         for cmd_idx, cmd in enumerate(commands_to_run):
-            print(f"\n{APP_NAME}: Executing command {cmd_idx+1}/{len(commands_to_run)}: {cmd}")
-            output = self.switch_comm.send_command(cmd)
-            all_outputs.append(f"--- Output for '{cmd}' ---\n{output}")
+            if batch_outputs is not None:
+                output = batch_outputs[cmd_idx]
+            else:
+                print(f"\n{APP_NAME}: Executing command {cmd_idx+1}/{len(commands_to_run)}: {cmd}")
+                output = self.switch_comm.send_command(cmd)
+            if all_outputs.tell():
+                all_outputs.write("\n\n")
+            all_outputs.write(f"--- Output for '{cmd}' ---\n")
+            all_outputs.write(output)
             
-            if "%" in output.splitlines()[0] if output.strip() else False:
-                error_line = next((line for line in output.splitlines() if "%" in line), "Error indication found.")
+            error_match = _ERR_RE.search(output)
+            if error_match:
+                error_line = error_match.group(0).strip()
                 print(f"{APP_NAME}: Potential error detected executing '{cmd}': {error_line}")
-                all_outputs.append(f"Error detected: {error_line}")
+                all_outputs.write(f"\n\nError detected: {error_line}")
                 success = False
-                print(f"{APP_NAME}: Stopping command execution due to potential error.")
+                if batch_outputs is not None and cmd_idx + 1 < len(commands_to_run):
+                    print(f"{APP_NAME}: Note: the remaining {len(commands_to_run) - cmd_idx - 1} batched command(s) were already sent.")
+                else:
+                    print(f"{APP_NAME}: Stopping command execution due to potential error.")
                 break 
-        return all_outputs, success
+        return all_outputs.getvalue(), success, verification_output
 
     def _process_user_query(self, user_query: str):
         print(f"\n{APP_NAME}: Processing '{user_query}'...")
@@ -181,30 +202,29 @@ class CiscoAIAssistant:
         info_retrieval_cmd = llm_data.get("information_retrieval_command", "")
         requires_extraction = llm_data.get("requires_answer_extraction", False)
 
-        prep_outputs, prep_success = [], True
+        prep_outputs, prep_success, verification_output = "", True, None
         if commands_to_run:
             if query_type == "QUESTION" and commands_to_run:
                  print(f"{APP_NAME}: LLM suggested preparatory commands before information retrieval.")
-            prep_outputs, prep_success = self._execute_commands(commands_to_run)
+            fused_verification_cmd = info_retrieval_cmd if query_type == "TASK" else ""
+            prep_outputs, prep_success, verification_output = self._execute_commands(commands_to_run, fused_verification_cmd)
         
         if not prep_success:
             print(f"{APP_NAME}: Failed to execute preparatory/task commands. Aborting further actions for this query.")
-            final_response = f"{APP_NAME}: Task execution failed.\n"
-            final_response += "\n--- Combined raw output from commands ---\n"
-            final_response += "\n\n".join(prep_outputs)
-            final_response += "\n--- End of raw output ---\n"
-            print(f"\n{final_response}")
+            print(f"\n{APP_NAME}: Task execution failed.\n")
+            print("--- Combined raw output from commands ---")
+            print(prep_outputs)
+            print("--- End of raw output ---\n")
             self.switch_comm.get_current_mode_and_prompt()
             return
 
         if query_type == "TASK":
             print(f"{APP_NAME}: Task execution sequence complete.")
             if info_retrieval_cmd:
-                print(f"\n{APP_NAME}: Now running verification command: {info_retrieval_cmd}")
-                time.sleep(0.5)
-                verification_output = self.switch_comm.send_command(info_retrieval_cmd, timeout_override=15)
+                if verification_output is None:
+                    print(f"\n{APP_NAME}: Now running verification command: {info_retrieval_cmd}")
+                    verification_output = self.switch_comm.send_command(info_retrieval_cmd, timeout_override=15)
                 
-                response_message = f"{APP_NAME}: VLAN 100 Management is created:"
                 response_message = f"{APP_NAME}: Task completed. Verification output for '{info_retrieval_cmd}':"
                 print(f"{response_message}\n{verification_output}")
             else:
@@ -212,7 +232,7 @@ class CiscoAIAssistant:
             
             if prep_outputs:
                 print("\n--- Raw output from task commands ---")
-                print("\n\n".join(prep_outputs))
+                print(prep_outputs)
                 print("--- End of raw output ---")
 
 
@@ -244,12 +264,12 @@ class CiscoAIAssistant:
             print(f"{APP_NAME}: I'm not sure how to handle that request (LLM type: {query_type}).")
             if prep_outputs:
                 print("\n--- Raw output from attempted commands ---")
-                print("\n\n".join(prep_outputs))
+                print(prep_outputs)
                 print("--- End of raw output ---")
 
 
-        current_mode, current_prompt = self.switch_comm.get_current_mode_and_prompt()
-        print(f"\n{APP_NAME}: Switch is now in mode: {current_mode} (Prompt: '{current_prompt}')")
+        # The prompt read after the last command already reflects the current mode, no extra probe needed
+        print(f"\n{APP_NAME}: Switch is now in mode: {self.switch_comm.current_mode} (Prompt: '{self.switch_comm.current_prompt_str}')")
 
 
 def main():
@@ -1,8 +1,14 @@
-import json
+try:
+    import orjson as _json # Faster parsing when available
+except ImportError:
+    import json as _json
 import os
+import functools
 
 CREDENTIALS_FILE = "cisco_ai_assistant/credentials.json"
+REQUIRED_KEYS = frozenset({"switch_username", "switch_password", "switch_enable_password", "gemini_api_key"})
 
+@functools.lru_cache(maxsize=1)
 def load_config():
     """Loads configuration from the credentials file."""
     if not os.path.exists(CREDENTIALS_FILE):
@@ -11,15 +17,14 @@ def load_config():
             f"Please create it by copying and modifying credentials.json.example."
         )
     try:
-        with open(CREDENTIALS_FILE, 'r') as f:
-            config = json.load(f)
+        with open(CREDENTIALS_FILE, 'rb') as f:
+            config = _json.loads(f.read())
         
-        required_keys = ["switch_username", "switch_password", "switch_enable_password", "gemini_api_key"]
-        for key in required_keys:
-            if key not in config or not config[key]:
-                raise ValueError(f"Missing or empty value for '{key}' in {CREDENTIALS_FILE}")
+        missing = REQUIRED_KEYS - {key for key, value in config.items() if value}
+        if missing:
+            raise ValueError(f"Missing or empty value for {sorted(missing)} in {CREDENTIALS_FILE}")
         return config
-    except json.JSONDecodeError:
+    except _json.JSONDecodeError:
         raise ValueError(f"Error decoding JSON from {CREDENTIALS_FILE}.")
     except Exception as e:
         raise RuntimeError(f"Could not load configuration: {e}")
\ No newline at end of file
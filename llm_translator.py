@@ -1,41 +1,218 @@
-import google.generativeai as genai
-import json
+from google import genai
+try:
+    import orjson as _json # Faster parsing when available
+except ImportError:
+    import json as _json
+import re
+import copy
+from collections import OrderedDict
 from .prompts import GEMINI_SYSTEM_PROMPT, GEMINI_ANSWER_EXTRACTION_PROMPT
 
+COMMAND_CACHE_SIZE = 256
+SEMANTIC_CACHE_MODEL = "all-MiniLM-L6-v2"
+SEMANTIC_CACHE_THRESHOLD = 0.92
+# Literals that change what a plan does (VLAN ids, interface names, addresses, quoted names).
+# Two queries only share a semantic cache entry when these are identical.
+_QUERY_LITERAL_RE = re.compile(r"\"[^\"]*\"|'[^']*'|[A-Za-z][\w.-]*\d[\w./-]*|\d[\w./:-]*")
+_JSON_RE = re.compile(r"\{.*\}", re.DOTALL)
+# Values filled in when the LLM omits a key from its plan
+_LLM_DEFAULTS = {
+    "commands_to_execute": [],
+    "information_retrieval_command": "",
+    "requires_answer_extraction": False,
+    "query_type": "UNKNOWN",
+}
+
+LOCAL_EXTRACTION_MAX_OUTPUT = 512
+# (question pattern, output pattern, answer builder) for questions simple enough to answer without the LLM.
+# The builder gets both matches and returns the answer, or None if the output line does not fit the question.
+_LOCAL_EXTRACTORS = (
+    (
+        re.compile(r"\bname\b.*\bvlan\s+(\d+)", re.IGNORECASE),
+        re.compile(r"^(\d+)\s+(\S+)\s+(?:active|suspended|act/lshut|sus/lshut)\b", re.MULTILINE),
+        lambda q, o: f"VLAN {q.group(1)} is named {o.group(2)}." if o.group(1) == q.group(1) else None,
+    ),
+    (
+        re.compile(r"\b(?:status|up|down)\b.*\binterface\b|\binterface\b.*\b(?:status|up|down)\b", re.IGNORECASE),
+        re.compile(r"^(\S+) is (administratively down|up|down), line protocol is (up|down)", re.MULTILINE),
+        lambda q, o: f"{o.group(1)} is {o.group(2)}, line protocol is {o.group(3)}.",
+    ),
+    (
+        re.compile(r"\bip\s+address\b", re.IGNORECASE),
+        re.compile(r"^\s*Internet address is (\S+)", re.MULTILINE),
+        lambda q, o: f"The IP address is {o.group(1)}.",
+    ),
+)
+
+def _extract_answer_locally(question: str, switch_output: str):
+    """Returns an answer when a single output line unambiguously answers a known question shape, else None."""
+    if len(switch_output) >= LOCAL_EXTRACTION_MAX_OUTPUT:
+        return None
+    for question_re, output_re, build_answer in _LOCAL_EXTRACTORS:
+        question_match = question_re.search(question)
+        if not question_match:
+            continue
+        answers = [answer for answer in (build_answer(question_match, m) for m in output_re.finditer(switch_output)) if answer]
+        return answers[0] if len(answers) == 1 else None
+    return None
+
+class _JsonBraceTracker:
+    """Tracks brace depth over streamed text, ignoring braces inside JSON strings."""
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> bool:
+        """Returns True once the first top-level JSON object has been closed."""
+        for ch in text:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"' and self.started:
+                self.in_string = True
+            elif ch == "{":
+                self.depth += 1
+                self.started = True
+            elif ch == "}" and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
 class LLMTranslator:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, semantic_cache: bool = False):
         if not api_key:
             raise ValueError("Gemini API key is required.")
-        genai.configure(api_key=api_key)
-        #self.model = genai.GenerativeModel('gemini-2.5-pro-preview-05-06')
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
-        #self.model = genai.GenerativeModel('gemini-1.5-flash-latest') 
+        # A single client keeps its HTTP connection pool alive, so TLS setup is paid once per session
+        self._client = genai.Client(api_key=api_key)
+        #self.model_name = 'gemini-2.5-pro-preview-05-06'
+        self.model_name = 'gemini-2.0-flash'
+        #self.model_name = 'gemini-1.5-flash-latest'
+        self._cmd_cache = OrderedDict() # (query, model, mode, prompt) -> parsed plan
+        self.semantic_cache = semantic_cache
+        self._embedder = None # Loaded on first use, sentence-transformers is optional
+        self._emb_matrix = None # L2-normalized float32 rows, one per cached plan
+        self._emb_entries = [] # (switch_model, current_mode, query literals, parsed plan) parallel to _emb_matrix
+        self._prompt_prefix_cache = {} # (model, mode, prompt) -> formatted system prompt, a handful of entries per session
+
+    def _embed_query(self, user_query: str):
+        """Returns a normalized embedding of the query, or None if the semantic cache is unavailable."""
+        if not self.semantic_cache:
+            return None
+        if self._embedder is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+                self._embedder = SentenceTransformer(SEMANTIC_CACHE_MODEL)
+            except Exception as e:
+                print(f"LLM Warning: Semantic cache disabled, could not load embedding model: {e}")
+                self.semantic_cache = False
+                return None
+        return self._embedder.encode(user_query.strip().lower(), normalize_embeddings=True).astype("float32")
+
+    def _semantic_lookup(self, query_emb, user_query: str, switch_model: str, current_mode: str):
+        """
+        Returns the plan of a cached query that means the same thing, or None.
+        "vlan 100" and "vlan 200" embed almost identically, so the literals must match exactly too.
+        """
+        if query_emb is None or self._emb_matrix is None:
+            return None
+        literals = tuple(_QUERY_LITERAL_RE.findall(user_query))
+        similarities = self._emb_matrix @ query_emb
+        for idx in similarities.argsort()[::-1]:
+            if similarities[idx] <= SEMANTIC_CACHE_THRESHOLD:
+                break
+            entry_model, entry_mode, entry_literals, plan = self._emb_entries[idx]
+            if (entry_model, entry_mode, entry_literals) == (switch_model, current_mode, literals):
+                return plan
+        return None
+
+    def _semantic_store(self, query_emb, user_query: str, switch_model: str, current_mode: str, plan: dict):
+        # Only read-only plans are reused by similarity; unquoted names in a TASK can't be told apart reliably
+        if query_emb is None or plan.get("query_type") != "QUESTION":
+            return
+        import numpy as np
+        row = query_emb.reshape(1, -1)
+        self._emb_matrix = row if self._emb_matrix is None else np.vstack((self._emb_matrix, row))
+        self._emb_entries.append((switch_model, current_mode, tuple(_QUERY_LITERAL_RE.findall(user_query)), copy.deepcopy(plan)))
 
     def _parse_llm_json_response(self, response_text: str, expected_keys: list) -> dict:
         """Helper to clean and parse JSON from LLM response."""
-        cleaned_response_text = response_text.strip()
-        if cleaned_response_text.startswith("```json"):
-            cleaned_response_text = cleaned_response_text[7:]
-        if cleaned_response_text.endswith("```"):
-            cleaned_response_text = cleaned_response_text[:-3]
-        cleaned_response_text = cleaned_response_text.strip()
-
-        json_start = cleaned_response_text.find('{')
-        json_end = cleaned_response_text.rfind('}')
-        if json_start != -1 and json_end != -1 and json_end > json_start:
-            json_str = cleaned_response_text[json_start : json_end+1]
-            parsed_response = json.loads(json_str)
-            for key in expected_keys:
-                if key not in parsed_response:
-                    if key == "commands_to_execute": parsed_response[key] = []
-                    elif key == "information_retrieval_command": parsed_response[key] = ""
-                    elif key == "requires_answer_extraction": parsed_response[key] = False
-                    elif key == "query_type": parsed_response[key] = "UNKNOWN"
-                    else:
-                        raise ValueError(f"LLM response missing required key: '{key}'")
-            return parsed_response
+        # Greedy match spans from the first '{' to the last '}', which also skips any ```json fences
+        json_match = _JSON_RE.search(response_text)
+        if json_match:
+            parsed_response = _json.loads(json_match.group(0))
+            missing = set(expected_keys) - parsed_response.keys() - _LLM_DEFAULTS.keys()
+            if missing:
+                raise ValueError(f"LLM response missing required key(s): {sorted(missing)}")
+            # Fresh list per response so cached plans never share the default list object
+            return {**_LLM_DEFAULTS, "commands_to_execute": [], **parsed_response}
         else:
-            raise ValueError(f"Could not parse JSON from LLM response: '{cleaned_response_text}'")
+            raise ValueError(f"Could not parse JSON from LLM response: '{response_text.strip()}'")
+
+    def _prepare_command_request(self, user_query: str, switch_model: str, current_mode: str, current_prompt: str):
+        """Returns (cached_plan, request, cache_key, query_emb). cached_plan is set on a cache hit, request holds generate_content kwargs."""
+        cache_key = (user_query.strip(), switch_model, current_mode, current_prompt)
+        if cache_key in self._cmd_cache:
+            self._cmd_cache.move_to_end(cache_key)
+            return copy.deepcopy(self._cmd_cache[cache_key]), None, cache_key, None
+
+        query_emb = self._embed_query(user_query)
+        similar_plan = self._semantic_lookup(query_emb, user_query, switch_model, current_mode)
+        if similar_plan is not None:
+            return copy.deepcopy(similar_plan), None, cache_key, query_emb
+
+        request = {"model": self.model_name}
+        prefix_key = (switch_model, current_mode, current_prompt)
+        prefix = self._prompt_prefix_cache.get(prefix_key)
+        if prefix is None:
+            prefix = self._prompt_prefix_cache[prefix_key] = GEMINI_SYSTEM_PROMPT.format(
+                switch_model=switch_model,
+                current_mode=current_mode,
+                current_prompt=current_prompt
+            )
+        
+        request["contents"] = f"{prefix}\n\nUser Request: \"{user_query}\"\nExample JSON Output:"
+        return None, request, cache_key, query_emb
+
+    def _read_json_stream(self, stream) -> str:
+        """Accumulates streamed chunks and stops as soon as the JSON object is complete."""
+        parts = []
+        tracker = _JsonBraceTracker()
+        for chunk in stream:
+            text = chunk.text or "" # Chunks carrying only metadata have no text
+            parts.append(text)
+            if tracker.feed(text):
+                break
+        # A malformed stream that never closes its object is simply drained to the end
+        return "".join(parts)
+
+    def _handle_command_response(self, response_text: str, cache_key: tuple, query_emb) -> dict:
+        expected_keys = ["query_type", "commands_to_execute", "information_retrieval_command", "requires_answer_extraction"]
+        parsed_data = self._parse_llm_json_response(response_text, expected_keys)
+        if parsed_data.get("query_type") != "ERROR":
+            self._cmd_cache[cache_key] = copy.deepcopy(parsed_data)
+            if len(self._cmd_cache) > COMMAND_CACHE_SIZE:
+                self._cmd_cache.popitem(last=False)
+            user_query, switch_model, current_mode, _ = cache_key
+            self._semantic_store(query_emb, user_query, switch_model, current_mode, parsed_data)
+        return parsed_data
+
+    def _command_error(self, e: Exception, response_text: str) -> dict:
+        if isinstance(e, _json.JSONDecodeError):
+            print(f"LLM Error (get_cisco_commands): Failed to decode JSON: {e}")
+            print(f"Problematic response text: {response_text}")
+            return {"query_type": "ERROR", "error": f"JSON Decode Error: {e}"}
+        if isinstance(e, ValueError): # Catch our custom ValueError from _parse_llm_json_response
+            print(f"LLM Error (get_cisco_commands): Invalid response structure: {e}")
+            return {"query_type": "ERROR", "error": f"Invalid LLM response: {e}"}
+        print(f"LLM Error (get_cisco_commands): An unexpected error occurred: {e}")
+        return {"query_type": "ERROR", "error": str(e)}
 
     def get_cisco_commands(self, user_query: str, switch_model: str, current_mode: str, current_prompt: str) -> dict:
         """
@@ -43,44 +220,34 @@ class LLMTranslator:
         Returns a dictionary with "query_type", "commands_to_execute",
         "information_retrieval_command", and "requires_answer_extraction".
         """
-        prompt_template = GEMINI_SYSTEM_PROMPT
-        full_query = prompt_template.format(
-            switch_model=switch_model,
-            current_mode=current_mode,
-            current_prompt=current_prompt
+        cached_plan, request, cache_key, query_emb = self._prepare_command_request(
+            user_query, switch_model, current_mode, current_prompt
         )
-        
-        full_query += f"\n\nUser Request: \"{user_query}\"\nExample JSON Output:"
+        if cached_plan is not None:
+            return cached_plan
 
+        response_text = "N/A"
         try:
-            response = self.model.generate_content(full_query)
-            
-            expected_keys = ["query_type", "commands_to_execute", "information_retrieval_command", "requires_answer_extraction"]
-            parsed_data = self._parse_llm_json_response(response.text, expected_keys)
-            return parsed_data
-
-        except json.JSONDecodeError as e:
-            print(f"LLM Error (get_cisco_commands): Failed to decode JSON: {e}")
-            print(f"Problematic response text: {response.text if 'response' in locals() else 'N/A'}")
-            return {"query_type": "ERROR", "error": f"JSON Decode Error: {e}"}
-        except ValueError as e: # Catch our custom ValueError from _parse_llm_json_response
-            print(f"LLM Error (get_cisco_commands): Invalid response structure: {e}")
-            return {"query_type": "ERROR", "error": f"Invalid LLM response: {e}"}
+            stream = self._client.models.generate_content_stream(**request)
+            response_text = self._read_json_stream(stream)
+            return self._handle_command_response(response_text, cache_key, query_emb)
         except Exception as e:
-            print(f"LLM Error (get_cisco_commands): An unexpected error occurred: {e}")
-            return {"query_type": "ERROR", "error": str(e)}
+            return self._command_error(e, response_text)
 
     def extract_answer_from_output(self, original_question: str, switch_output: str) -> str:
         """
         Uses LLM to extract a concise answer from switch output based on the original question.
         """
+        local_answer = _extract_answer_locally(original_question, switch_output)
+        if local_answer is not None:
+            return local_answer
         prompt = GEMINI_ANSWER_EXTRACTION_PROMPT.format(
             original_question=original_question,
             switch_output=switch_output
         )
         try:
-            response = self.model.generate_content(prompt)
+            response = self._client.models.generate_content(model=self.model_name, contents=prompt)
             return response.text.strip()
         except Exception as e:
             print(f"LLM Error (extract_answer): An unexpected error occurred: {e}")
-            return f"Error extracting answer: {e}"
\ No newline at end of file
+            return f"Error extracting answer: {e}"
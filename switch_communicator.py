@@ -1,25 +1,92 @@
 import serial
 import time
 import re
+import os
+import select
+import functools
 
 # DEBUG FLAG - TO SEE DETAILED SERIAL I/O
 SERIAL_DEBUG = False
-
-# Regex patterns for prompts
-PROMPT_PATTERNS = {
-    re.compile(r"[\w.-]+\(config-if\)#\s*$"): "CONF_IF",
-    re.compile(r"[\w.-]+\(config-vlan\)#\s*$"): "CONF_VLAN",
-    re.compile(r"[\w.-]+\(config-line\)#\s*$"): "CONF_LINE",
-    re.compile(r"[\w.-]+\(config\)#\s*$"): "CONF_TERM",
-    re.compile(r"[\w.-]+#\s*$"): "PRIVEXEC",
-    re.compile(r"[\w.-]+>\s*$"): "EXEC",
-    re.compile(r"(?i)Username:\s*$"): "LOGIN_USER", # Case insensitive
-    re.compile(r"(?i)Password:\s*$"): "LOGIN_PASS", # Case insensitive
-    re.compile(r"--More--\s*$"): "MORE",
-    re.compile(r"\(yes\/no\)\?:?\s*$"): "CONFIRM_YN",
-    re.compile(r"\[confirm\]\s*$"): "CONFIRM_ENTER",
-    re.compile(r"confirm.*\[yes\/no\]:\s*$"): "CONFIRM_FULL_YN",
+# Port read timeout: read(1) blocks in the kernel for at most this long while waiting for the first byte
+SERIAL_READ_TIMEOUT = 0.05
+# A mode read longer ago than this is re-probed: the console exec-timeout may have logged the session out meanwhile
+MODE_CACHE_MAX_AGE = 5
+# Bytes per os.read() on the raw tty fd (POSIX fast path)
+SERIAL_READ_CHUNK = 4096
+
+# Regex patterns for prompts. Prompts are 7-bit ASCII, so they are compiled as bytes and
+# matched against the raw receive buffer without decoding it first. Order matters: more specific prompts first.
+PROMPT_PATTERNS = (
+    (re.compile(rb"[\w.-]+\(config-if\)#\s*$"), "CONF_IF"),
+    (re.compile(rb"[\w.-]+\(config-vlan\)#\s*$"), "CONF_VLAN"),
+    (re.compile(rb"[\w.-]+\(config-line\)#\s*$"), "CONF_LINE"),
+    (re.compile(rb"[\w.-]+\(config\)#\s*$"), "CONF_TERM"),
+    (re.compile(rb"[\w.-]+#\s*$"), "PRIVEXEC"),
+    (re.compile(rb"[\w.-]+>\s*$"), "EXEC"),
+    (re.compile(rb"(?i:Username:)\s*$"), "LOGIN_USER"), # Case insensitive
+    (re.compile(rb"(?i:Password:)\s*$"), "LOGIN_PASS"), # Case insensitive
+    (re.compile(rb"--More--\s*$"), "MORE"),
+    (re.compile(rb"\(yes\/no\)\?:?\s*$"), "CONFIRM_YN"),
+    (re.compile(rb"\[confirm\]\s*$"), "CONFIRM_ENTER"),
+    (re.compile(rb"confirm.*\[yes\/no\]:\s*$"), "CONFIRM_FULL_YN"),
+)
+
+# All prompt patterns fused into one alternation, so the buffer is scanned once per poll.
+# The named group that matched (m.lastgroup) is the mode. No two prompts can match at the same
+# position, so whether a mode was expected is a membership test on the result, not a second scan.
+COMBINED_PROMPT_RE = re.compile(b"|".join(
+    b"(?P<" + mode.encode('ascii') + b">" + pattern.pattern + b")" for pattern, mode in PROMPT_PATTERNS
+))
+# Prompts are anchored to the end of the buffer, so only this many trailing bytes need scanning
+PROMPT_SCAN_TAIL = 256
+# Every prompt ends in one of these bytes (before trailing whitespace); otherwise no regex is run
+_PROMPT_TAILS = frozenset(b"#>:?]-")
+_WHITESPACE = frozenset(b" \t\r\n")
+# Pager marker left in a page of output
+# The lookbehind makes a blank run start only once, so long runs of spaces without a marker stay linear
+_MORE_MARKER_RE = re.compile(r"(?<![ \t])[ \t]*--More--[ \t]*")
+# A prompt at the start of a line, optionally followed by the echo of the next command
+PROMPT_LINE_RE = re.compile(r"^[\w.-]+(?:\([\w-]+\))?[#>]", re.MULTILINE)
+# Commands that (may) move the session to another CLI mode
+_MODE_CHANGE_RE = re.compile(r"^\s*(?:configure|end|exit|interface|vlan|line|router|enable|disable)\b", re.IGNORECASE)
+# One graceful step down per mode when disconnecting; EXEC is handled separately (its exit gets no prompt back)
+DISCONNECT_CLEANUP = {
+    "CONF_IF": b"exit\r",
+    "CONF_VLAN": b"exit\r",
+    "CONF_LINE": b"exit\r",
+    "CONF_TERM": b"end\r",
+    "PRIVEXEC": b"exit\r",
 }
+# Commands that may ask for confirmation and therefore must not be typed ahead in a batch
+INTERACTIVE_COMMAND_RE = re.compile(r"^\s*(?:reload|copy|erase|delete|write\s+erase|clear|format|squeeze|crypto\s+key)\b", re.IGNORECASE)
+# Commands that can be typed ahead: exec show commands, entering/leaving config mode, and single-line global
+# config commands. None of them enters a sub-mode, so a rejected line can never make IOS apply the lines typed
+# after it to some other context (a previous interface, ACL, class-map, DHCP pool, ...).
+BATCHABLE_COMMAND_RE = re.compile(
+    r"^\s*(?:"
+    r"(?:do\s+)?show\b|terminal\s+length\b|configure\s+terminal\s*$|end\s*$|"
+    r"(?:no\s+)?(?:hostname|ip\s+(?:domain[- ]name|name-server|default-gateway|route)|ntp\s+server|logging\s+host|"
+    r"snmp-server\s+(?:community|location|contact)|spanning-tree\s+mode|vtp\s+(?:mode|domain)|"
+    r"username|enable\s+secret|clock\s+timezone|cdp\s+run|lldp\s+run|service)\b"
+    r")",
+    re.IGNORECASE
+)
+
+
+def _last_non_space_byte(buf):
+    """Last non-whitespace byte of buf, or None. Trailing whitespace after a prompt is a byte or two."""
+    for i in range(len(buf) - 1, -1, -1):
+        if buf[i] not in _WHITESPACE:
+            return buf[i]
+    return None
+
+@functools.lru_cache(maxsize=256)
+def _enc_cmd(cmd: str) -> bytes:
+    """Command line as sent on the wire; repeated commands (exit, end, show ...) reuse the bytes."""
+    return (cmd + "\r").encode('ascii')
+
+def _discard_log(message):
+    pass
 
 
 class SwitchCommunicator:
@@ -33,78 +100,130 @@ class SwitchCommunicator:
         self.logged_in = False
         self.enable_mode_active = False
         self.last_full_output = "" # Store last full raw output from _read_until_prompt
+        self._mode_dirty = True # Cached mode/prompt must be re-probed from the switch
+        self._mode_read_at = 0.0 # time.monotonic() of the last prompt read from the switch
+        self._fd = None # Raw tty fd for select()/os.read() reads, None where pyserial must be used (e.g. Windows)
+        if not SERIAL_DEBUG:
+            self._log_debug = _discard_log # Shadows the method, so disabled logging costs no strftime/print
 
     def _log_debug(self, message):
-        if SERIAL_DEBUG:
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-            print(f"DEBUG {timestamp} [SwitchComm]: {message}")
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        print(f"DEBUG {timestamp} [SwitchComm]: {message}")
 
     def _read_until_prompt(self, custom_timeout=None, expected_specific_prompts=None):
-        output_buffer = ""
+        buf = bytearray() # Raw bytes, decoded once on return
         start_time = time.time()
         read_timeout = custom_timeout if custom_timeout is not None else self.timeout
+        expected_specific_prompts = frozenset(expected_specific_prompts or ())
         self._log_debug(f"_read_until_prompt: Timeout={read_timeout}s. Expecting specific: {expected_specific_prompts}")
 
         while True:
-            if self.connection and self.connection.in_waiting > 0:
+            new_data = False
+            read_failed = False # Port error or hang-up: nothing more will arrive, so the read ends now
+            if self.connection:
                 try:
-                    chunk = self.connection.read(self.connection.in_waiting).decode('utf-8', errors='replace')
-                    self._log_debug(f"Read chunk: {repr(chunk)}")
-                    output_buffer += chunk
+                    if self._fd is not None:
+                        # One kernel wait, then everything available in a single read
+                        ready, _, _ = select.select([self._fd], [], [], SERIAL_READ_TIMEOUT)
+                        data = os.read(self._fd, SERIAL_READ_CHUNK) if ready else b""
+                        if ready and not data:
+                            self._log_debug("Serial device hung up (readable but returned no data).")
+                            read_failed = True
+                    else:
+                        # Block until the first byte (or the short port timeout), then drain whatever else arrived
+                        data = self.connection.read(1)
+                        if data:
+                            waiting = self.connection.in_waiting
+                            if waiting:
+                                data += self.connection.read(waiting)
+                    if data:
+                        if SERIAL_DEBUG:
+                            self._log_debug(f"Read chunk: {repr(data)}")
+                        buf.extend(data)
+                        new_data = True
                 except Exception as e:
-                    self._log_debug(f"Error decoding serial data: {e}")
-
-            # Check for specific expected prompts first if provided
-            if expected_specific_prompts:
-                for mode_name_expected in expected_specific_prompts:
-                    for pattern, mode_name_map in PROMPT_PATTERNS.items():
-                        if mode_name_map == mode_name_expected:
-                            match = pattern.search(output_buffer)
-                            if match:
-                                self.current_prompt_str = match.group(0).strip()
-                                self.current_mode = mode_name_map
-                                self.last_full_output = output_buffer
-                                self._log_debug(f"Matched EXPECTED prompt! Mode='{self.current_mode}', Prompt='{self.current_prompt_str}'. Raw: {repr(output_buffer)}")
-                                return output_buffer # Return everything including the prompt
-            
-            # Check all known prompts
-            for pattern, mode_name in PROMPT_PATTERNS.items():
-                match = pattern.search(output_buffer) # Search anywhere in the buffer
-                if match:
-                    self.current_prompt_str = match.group(0).strip() # The matched prompt string
-                    self.current_mode = mode_name
-                    self.last_full_output = output_buffer # Store raw output up to prompt
-                    self._log_debug(f"Matched prompt! Mode='{self.current_mode}', Prompt='{self.current_prompt_str}'. Raw: {repr(output_buffer)}")
-                    return output_buffer # Return everything including the prompt
-
-            if time.time() - start_time > read_timeout:
+                    self._log_debug(f"Error reading serial data: {e}")
+                    read_failed = True
+            else:
+                time.sleep(SERIAL_READ_TIMEOUT)
+
+            # Cheap byte check first: the regex only runs when the buffer ends like a prompt
+            if new_data and _last_non_space_byte(buf) not in _PROMPT_TAILS:
+                new_data = False
+            match = new_data and COMBINED_PROMPT_RE.search(buf, max(0, len(buf) - PROMPT_SCAN_TAIL))
+            if match:
+                output_buffer = buf.decode('utf-8', errors='replace')
+                self.current_prompt_str = match.group(0).decode('ascii', errors='replace').strip() # The matched prompt string
+                self.current_mode = match.lastgroup
+                self._mode_read_at = time.monotonic()
+                self.last_full_output = output_buffer # Store raw output up to prompt
+                if SERIAL_DEBUG:
+                    label = "EXPECTED prompt" if self.current_mode in expected_specific_prompts else "prompt"
+                    self._log_debug(f"Matched {label}! Mode='{self.current_mode}', Prompt='{self.current_prompt_str}'. Raw: {repr(output_buffer)}")
+                return output_buffer # Return everything including the prompt
+
+            if read_failed or time.time() - start_time > read_timeout:
+                output_buffer = buf.decode('utf-8', errors='replace')
                 self.last_full_output = output_buffer # Store what we got
-                self._log_debug(f"Timeout in _read_until_prompt. Buffer: {repr(output_buffer)}")
+                if SERIAL_DEBUG:
+                    self._log_debug(f"Timeout in _read_until_prompt. Buffer: {repr(output_buffer)}")
                 self.current_prompt_str = output_buffer.splitlines()[-1].strip() if output_buffer.strip() else "TIMEOUT_NO_OUTPUT"
                 self.current_mode = "UNKNOWN_TIMEOUT"
+                self._mode_dirty = True
                 return output_buffer # Return what we have
 
-            time.sleep(0.15)
-
-    def _send_and_read(self, data_bytes: bytes, read_timeout: int, expected_prompts=None):
-        """Helper to send bytes and read response until prompt or timeout."""
+    def _send_and_read(self, data_bytes: bytes, read_timeout: int, expected_prompts=None, post_write_delay=0):
+        """
+        Helper to send bytes and read response until prompt or timeout.
+        The read loop waits for the switch by itself; post_write_delay is only for firmware that needs a pause.
+        """
         if not self.connection or not self.connection.is_open:
             self._log_debug("_send_and_read: Not connected.")
             return "Error: Not connected."
-        self._log_debug(f"Writing bytes: {repr(data_bytes)}")
+        if SERIAL_DEBUG:
+            self._log_debug(f"Writing bytes: {repr(data_bytes)}")
         self.connection.write(data_bytes)
         self.connection.flush()
-        time.sleep(0.2) 
+        if post_write_delay:
+            time.sleep(post_write_delay)
         return self._read_until_prompt(custom_timeout=read_timeout, expected_specific_prompts=expected_prompts)
 
+    def _enable_low_latency(self):
+        """
+        Best-effort: sets ASYNC_LOW_LATENCY on the tty (Linux) so USB-serial adapters
+        push bytes immediately instead of after their 16 ms latency timer.
+        """
+        set_low_latency = getattr(self.connection, "set_low_latency_mode", None)
+        if set_low_latency is None:
+            # e.g. Windows COM ports; FTDI latency there is a driver/registry setting
+            self._log_debug("Low-latency mode not supported on this platform.")
+            return
+        try:
+            set_low_latency(True)
+            self._log_debug("Low-latency mode enabled on serial port.")
+        except Exception as e:
+            self._log_debug(f"Could not enable low-latency mode: {e}")
+
+    def _raw_fd(self):
+        """File descriptor of the open port on POSIX, None where reads must go through pyserial."""
+        if os.name != "posix":
+            return None
+        try:
+            return self.connection.fileno()
+        except Exception as e:
+            self._log_debug(f"No usable file descriptor, using pyserial reads: {e}")
+            return None
+
     def connect(self):
         if self.connection and self.connection.is_open:
             self._log_debug("Connect: Already connected.")
             return True
         try:
             self._log_debug(f"Attempting to connect to {self.port} at {self.baudrate} baud...")
-            self.connection = serial.Serial(self.port, self.baudrate, timeout=0.1)
+            self.connection = serial.Serial(self.port, self.baudrate, timeout=SERIAL_READ_TIMEOUT)
             self._log_debug(f"Serial port {self.port} opened.")
+            self._enable_low_latency()
+            self._fd = self._raw_fd()
             
             # Send an initial CRNL to clear buffers and elicit a prompt.
             self._log_debug("Sending initial CRNL to elicit prompt.")
@@ -113,17 +232,19 @@ class SwitchCommunicator:
             time.sleep(1) # Give the switch more time to respond initially
 
             initial_output_raw = self._read_until_prompt(custom_timeout=15)
-            self._log_debug(f"Initial connection raw output: {repr(initial_output_raw)}")
+            if SERIAL_DEBUG:
+                self._log_debug(f"Initial connection raw output: {repr(initial_output_raw)}")
             self._log_debug(f"Post-connect state: Mode='{self.current_mode}', Prompt='{self.current_prompt_str}'")
 
             # If still no recognized prompt, try one more CR
-            if self.current_mode == "UNKNOWN_TIMEOUT" and not self.current_prompt_str.strip().endswith(tuple(PROMPT_PATTERNS.keys())): # Check if prompt is known
+            if self.current_mode == "UNKNOWN_TIMEOUT": # No known prompt at the end of the output
                  self._log_debug("Warning: No clear prompt detected. Sending another CR.")
                  self.connection.write(b'\r')
                  self.connection.flush()
                  time.sleep(0.5)
                  second_attempt_raw = self._read_until_prompt(custom_timeout=5)
-                 self._log_debug(f"Second attempt raw output: {repr(second_attempt_raw)}")
+                 if SERIAL_DEBUG:
+                     self._log_debug(f"Second attempt raw output: {repr(second_attempt_raw)}")
                  self._log_debug(f"Post-connect 2nd attempt state: Mode='{self.current_mode}', Prompt='{self.current_prompt_str}'")
             
             if self.current_mode in ["DISCONNECTED", "UNKNOWN_TIMEOUT"] or not self.current_prompt_str:
@@ -172,7 +293,7 @@ class SwitchCommunicator:
         # Step 1: Username
         if self.current_mode == "LOGIN_USER":
             self._log_debug(f"Sending username: '{username}'")
-            self._send_and_read(f"{username}\r".encode('ascii'), read_timeout=10, expected_prompts=["LOGIN_PASS"])
+            self._send_and_read(_enc_cmd(username), read_timeout=10, expected_prompts=["LOGIN_PASS"])
             self._log_debug(f"Login: After username. Mode: {self.current_mode}, Prompt: '{self.current_prompt_str}'")
             if self.current_mode != "LOGIN_PASS":
                 print(f"Login Error: Expected password prompt after username, got mode '{self.current_mode}' (prompt: '{self.current_prompt_str}'). Raw: {repr(self.last_full_output)}")
@@ -250,70 +371,126 @@ class SwitchCommunicator:
         self._log_debug(f"Sending command ({self.current_mode}): '{command}' with timeout {effective_timeout}s")
         
         # Send command with CR
-        raw_output_from_send = self._send_and_read(f"{command}\r".encode('ascii'), read_timeout=effective_timeout)
+        if _MODE_CHANGE_RE.match(command):
+            self._mode_dirty = True
+        raw_output_from_send = self._send_and_read(_enc_cmd(command), read_timeout=effective_timeout)
         
         # The raw_output_from_send includes the command echo (usually) and the prompt.
-        output_lines = raw_output_from_send.splitlines()
-        cleaned_output_lines = []
-
-        if output_lines:
-            # Check if the first non-empty line is the command echo
-            first_content_line_idx = 0
-            while first_content_line_idx < len(output_lines) and not output_lines[first_content_line_idx].strip():
-                first_content_line_idx += 1
-            
-            if first_content_line_idx < len(output_lines):
-                if output_lines[first_content_line_idx].strip() == command.strip():
-                    self._log_debug(f"Send_command ('{command}'): Stripping echo: '{output_lines[first_content_line_idx]}'")
-                    cleaned_output_lines = output_lines[first_content_line_idx+1:]
-                else:
-                    cleaned_output_lines = output_lines
-            else: # All lines were empty
-                cleaned_output_lines = output_lines
-        else: # No output lines
-            cleaned_output_lines = output_lines
-            
-        # Join back and then strip the prompt from the end
-        interim_output = "\n".join(cleaned_output_lines).strip()
-        
+        # The echo is the first non-whitespace content, so strip it by slicing instead of splitting lines.
+        cmd = command.strip()
+        interim_output = raw_output_from_send.replace("\r", "").lstrip()
+        if interim_output.startswith(cmd) and interim_output[len(cmd):len(cmd) + 1] in ("", "\n"):
+            self._log_debug(f"Send_command ('{command}'): Stripping echo: '{cmd}'")
+            interim_output = interim_output[len(cmd):].lstrip("\n")
+        interim_output = interim_output.rstrip()
+
         # Strip the detected prompt from the very end of the interim_output
         final_cleaned_output = interim_output
         if self.current_prompt_str and interim_output.endswith(self.current_prompt_str):
             final_cleaned_output = interim_output[:-len(self.current_prompt_str)].strip()
             self._log_debug(f"Send_command ('{command}'): Stripped prompt '{self.current_prompt_str}' from end.")
 
-        if final_cleaned_output == command.strip():
+        if final_cleaned_output == cmd:
             final_cleaned_output = ""
 
 
-        # Handle "--More--"
-        full_response_so_far = final_cleaned_output
+        # Handle "--More--": each page is cleaned once as it arrives, never re-scanning earlier pages
+        response_parts = [_MORE_MARKER_RE.sub("", final_cleaned_output).strip()]
         while self.current_mode == "MORE":
             self._log_debug(f"Send_command ('{command}'): Detected --More--. Sending space.")
-            if full_response_so_far.endswith("--More--"): # Simple check
-                 full_response_so_far = full_response_so_far[:-len("--More--")].strip()
-            elif "--More--" in full_response_so_far: # If it's not exactly at the end
-                 full_response_so_far = full_response_so_far.replace("--More--", "").strip()
-
 
             more_raw_output = self._send_and_read(b" ", read_timeout=effective_timeout) # Send space
             
-            more_output_lines = more_raw_output.splitlines()
-            more_cleaned_interim = "\n".join(more_output_lines).strip() # No echo to strip for space typically
+            more_cleaned_interim = more_raw_output.replace("\r", "").strip() # No echo to strip for space typically
             more_final_cleaned = more_cleaned_interim
             if self.current_prompt_str and more_cleaned_interim.endswith(self.current_prompt_str) and self.current_mode != "MORE":
                 more_final_cleaned = more_cleaned_interim[:-len(self.current_prompt_str)].strip()
 
-            full_response_so_far += "\n" + more_final_cleaned.strip()
+            response_parts.append(_MORE_MARKER_RE.sub("", more_final_cleaned).strip())
             self._log_debug(f"Send_command ('{command}'): Appended more data. Current mode: {self.current_mode}")
         
-        self._log_debug(f"Send_command ('{command}') RSP (final cleaned):\n{full_response_so_far.strip()}")
-        return full_response_so_far.strip()
+        full_response = "\n".join(response_parts).strip()
+        if SERIAL_DEBUG:
+            self._log_debug(f"Send_command ('{command}') RSP (final cleaned):\n{full_response}")
+        return full_response
+
+    def can_batch(self, commands: list) -> bool:
+        """True if every command is known not to enter a sub-mode and none can stop for an interactive confirmation."""
+        return len(commands) > 1 and all(
+            BATCHABLE_COMMAND_RE.match(cmd) and not INTERACTIVE_COMMAND_RE.match(cmd) for cmd in commands
+        )
+
+    def send_command_batch(self, commands: list, timeout_override=None) -> list:
+        """
+        Sends several commands in a single write and waits only for the final prompt.
+        Returns one cleaned output per command, split on the prompt that precedes each echo.
+        """
+        if not self.connection or not self.connection.is_open:
+            self._log_debug("Send_command_batch: Not connected.")
+            return ["Error: Not connected."] * len(commands)
+
+        to_send = [cmd for cmd in commands if cmd.strip()]
+        if not to_send:
+            return [""] * len(commands)
+
+        effective_timeout = timeout_override if timeout_override is not None else self.timeout
+        if any(_MODE_CHANGE_RE.match(cmd) for cmd in to_send):
+            self._mode_dirty = True
+        payload = b"".join(_enc_cmd(cmd) for cmd in to_send)
+        if SERIAL_DEBUG:
+            self._log_debug(f"Writing batch of {len(to_send)} commands: {repr(payload)}")
+        self.connection.write(payload)
+        self.connection.flush()
+
+        raw_chunks = []
+        prompts_seen = 0
+        while True:
+            chunk = self._read_until_prompt(custom_timeout=effective_timeout)
+            raw_chunks.append(chunk)
+            # Each command is answered by exactly one new prompt. Every chunk ends at a prompt (or --More--),
+            # so counting per chunk never splits a prompt line and avoids rescanning earlier output.
+            # Pages that stop at --More-- still carry the prompts of the commands before them.
+            prompts_seen += len(PROMPT_LINE_RE.findall(chunk))
+            if self.current_mode == "UNKNOWN_TIMEOUT":
+                if SERIAL_DEBUG:
+                    self._log_debug(f"Send_command_batch: Timeout before all prompts arrived. Raw: {repr(''.join(raw_chunks))}")
+                break
+            if self.current_mode == "MORE":
+                self.connection.write(b" ")
+                self.connection.flush()
+                continue
+            if prompts_seen >= len(to_send):
+                break
+        raw_output = "".join(raw_chunks)
+
+        # Segment i starts at the prompt line carrying the echo of command i (the first echo has no prompt,
+        # it was consumed before the write) and ends where the next prompt line starts.
+        prompt_starts = [m.start() for m in PROMPT_LINE_RE.finditer(raw_output)]
+        boundaries = [0] + prompt_starts[:len(to_send)]
+        segment_outputs = []
+        for idx, cmd in enumerate(to_send):
+            if idx + 1 >= len(boundaries):
+                segment_outputs.append("")
+                continue
+            segment = raw_output[boundaries[idx]:boundaries[idx + 1]].replace("--More--", "").replace("\r", "")
+            first_line, _, rest = segment.partition("\n")
+            if first_line.strip().endswith(cmd.strip()):
+                segment = rest
+            segment_outputs.append(segment.strip())
+
+        segment_iter = iter(segment_outputs)
+        outputs = [next(segment_iter) if cmd.strip() else "" for cmd in commands]
+        if SERIAL_DEBUG:
+            self._log_debug(f"Send_command_batch RSP: {outputs}")
+        return outputs
 
     def get_current_mode_and_prompt(self):
-        if self.connection and self.connection.is_open:
+        if time.monotonic() - self._mode_read_at > MODE_CACHE_MAX_AGE:
+            self._mode_dirty = True
+        if self.connection and self.connection.is_open and self._mode_dirty:
             self._log_debug("get_current_mode_and_prompt: Sending CR to refresh prompt.")
-            self._send_and_read(b'\r', read_timeout=3) # Short timeout for prompt refresh
+            self._mode_dirty = False
+            self._send_and_read(b'\r', read_timeout=3) # Short timeout for prompt refresh (re-dirties on timeout)
         self._log_debug(f"get_current_mode_and_prompt: Mode='{self.current_mode}', Prompt='{self.current_prompt_str}'")
         return self.current_mode, self.current_prompt_str
         
@@ -322,12 +499,11 @@ class SwitchCommunicator:
             self._log_debug("Disconnecting...")
             try:
                 # Graceful exit attempts
-                if self.current_mode.startswith("CONF_") and self.current_mode != "CONF_TERM":
-                    self.send_command("exit", expect_prompt_after=True, timeout_override=3)
-                if self.current_mode == "CONF_TERM":
-                    self.send_command("end", expect_prompt_after=True, timeout_override=3)
-                if self.current_mode == "PRIVEXEC":
-                     self.send_command("exit", expect_prompt_after=True, timeout_override=3) # To EXEC
+                for _ in range(5): # Guard against a mode that never changes
+                    cleanup_cmd = DISCONNECT_CLEANUP.get(self.current_mode)
+                    if cleanup_cmd is None:
+                        break
+                    self._send_and_read(cleanup_cmd, read_timeout=3)
                 if self.current_mode == "EXEC":
                      self._log_debug("Sending final 'exit' from EXEC mode.")
                      self.connection.write(b"exit\r")
@@ -343,7 +519,9 @@ class SwitchCommunicator:
             self._log_debug("Disconnect: No active connection or already closed.")
             
         self.connection = None # Ensure connection object is cleared
+        self._fd = None
         self.current_mode = "DISCONNECTED"
+        self._mode_dirty = True
         self.current_prompt_str = ""
         self.logged_in = False
         self.enable_mode_active = False